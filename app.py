@@ -1,11 +1,11 @@
 import streamlit as st
-from PIL import Image
-import io
+import html
 import logging
 import time
-from suggest_cosmetics_ml import load_model, predict_cosmetics
-from itertools import groupby
-from operator import itemgetter
+from app.models.cosmetics_model import decode_image_bytes, predict_skin_tone
+from app.models.init_models import get_race_model, start_background_warmup
+from app.data.cosmetics_db import PRODUCTS_BY_TONE, BRANDS_BY_TONE, PRODUCT_TYPES_BY_TONE
+from collections import defaultdict
 
 
 # Configure logging
@@ -74,29 +74,65 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Load the analysis model while the user picks a photo
+start_background_warmup()
+
 # Cache the model loading to avoid reloading on each interaction
 @st.cache_resource
 def get_model():
     """Load and cache the model for reuse."""
-    logger.info("Loading model...")
-    return load_model()
+    # Wait for the background warm-up, which loads the same cached model
+    start_background_warmup().join()
+    return get_race_model()
+
+# Cache results by upload content so filter-only reruns skip the analysis;
+# failures raise instead, so they are retried rather than cached
+@st.cache_data(show_spinner=False)
+def detect_skin_tone_with_timing(image_bytes):
+    """Decode image bytes and detect the skin tone with timing.
+    
+    Returns:
+        Tuple of (skin tone, processing time in seconds)
+    """
+    start_time = time.time()
+    # Decode straight to a BGR array, skipping the PIL round-trip
+    img = decode_image_bytes(image_bytes)
+    
+    model = get_model()  # Get cached model
+    skin_tone = predict_skin_tone(model, img)
+    
+    processing_time = time.time() - start_time
+    logger.info("Prediction completed in %.2f seconds", processing_time)
+    
+    return skin_tone, processing_time
 
-def suggest_cosmetics_with_timing(image):
-    """Process image and suggest cosmetics with timing."""
+def suggest_cosmetics_with_timing(image_bytes):
+    """Process image bytes and detect the skin tone with timing.
+    
+    Returns:
+        Tuple of (skin tone or None, processing time in seconds, error message or None)
+    """
     try:
-        start_time = time.time()
-        img = Image.open(io.BytesIO(image.read())).convert("RGB")
-        
-        model = get_model()  # Get cached model
-        predictions = predict_cosmetics(model, img)
-        
-        processing_time = time.time() - start_time
-        logger.info("Prediction completed in %.2f seconds", processing_time)
-        
-        return predictions, processing_time
+        skin_tone, processing_time = detect_skin_tone_with_timing(image_bytes)
+        return skin_tone, processing_time, None
     except Exception as e:
-        logger.error("Error in cosmetic suggestion: {str(e)}")
-        return [{"error": f"Processing failed: {str(e)}"}], 0
+        logger.error(f"Error in cosmetic suggestion: {str(e)}")
+        return None, 0, f"Processing failed: {str(e)}"
+
+def make_product_filter(brand_filter=None, product_type_filter=None):
+    """
+    Build a product predicate specialized for the active filters.
+    
+    Each variant only checks the filters that are set, so the grouping loop
+    does not re-test which filters are active for every product.
+    """
+    if brand_filter is None and product_type_filter is None:
+        return lambda item: True
+    if brand_filter is None:
+        return lambda item: product_type_filter in item["_name_lc"]
+    if product_type_filter is None:
+        return lambda item: item["brand"] == brand_filter
+    return lambda item: item["brand"] == brand_filter and product_type_filter in item["_name_lc"]
 
 def group_products_by_category(product_list, max_per_category=3, brand_filter=None, product_type_filter=None):
     """
@@ -111,67 +147,47 @@ def group_products_by_category(product_list, max_per_category=3, brand_filter=No
     Returns:
         Dictionary of categorized and filtered products
     """
-    # Extract category from product name (e.g., "Foundation" from "Foundation")
-    def get_category(product):
-        name = product["name"]
-        # Handle special cases like "Eyeshadow Palette" -> "Eye Products"
-        if "eyeshadow" in name.lower() or "eyeliner" in name.lower() or "mascara" in name.lower() or "eyebrow" in name.lower():
-            return "Eye Products"
-        elif "lipstick" in name.lower() or "lip gloss" in name.lower() or "lip liner" in name.lower():
-            return "Lip Products"
-        elif "blush" in name.lower() or "bronzer" in name.lower() or "highlighter" in name.lower():
-            return "Cheek Products"
-        elif "foundation" in name.lower() or "concealer" in name.lower() or "powder" in name.lower():
-            return "Face Products"
-        else:
-            return "Other Products"
+    # Filter and bucket in a single pass; categories and lowercased names are
+    # precomputed, and the product tuples come sorted by category and name,
+    # so each category keeps its first max_per_category matches
+    grouped = defaultdict(list)
+    for item in filter(make_product_filter(brand_filter, product_type_filter), product_list):
+        bucket = grouped[item["category"]]
+        if len(bucket) < max_per_category:
+            bucket.append(item)
     
-    # Apply filters first
-    filtered_products = []
-    for item in product_list:
-        if "error" not in item:
-            # Apply brand filter if specified
-            if brand_filter and item["brand"] != brand_filter:
-                continue
-                
-            # Apply product type filter if specified
-            if product_type_filter and product_type_filter not in item["name"].lower():
-                continue
-                
-            product_with_category = item.copy()
-            product_with_category["category"] = get_category(item)
-            filtered_products.append(product_with_category)
-        else:
-            filtered_products.append(item)
+    return dict(grouped)
+
+# Memoize the rendered block per filter state so repeated states are lookups
+@st.cache_data(show_spinner=False)
+def render_recommendations_html(skin_tone, max_per_category, brand_filter, product_type_filter):
+    """
+    Build the recommendations HTML for one skin tone and filter combination.
     
-    # Sort by category
-    filtered_products.sort(key=itemgetter("category", "name"))
+    Returns:
+        Tuple of (HTML block for all categories, number of products shown)
+    """
+    grouped_products = group_products_by_category(
+        PRODUCTS_BY_TONE[skin_tone],
+        max_per_category=max_per_category,
+        brand_filter=brand_filter,
+        product_type_filter=product_type_filter
+    )
     
-    # Group by category
-    grouped = {}
-    for key, group in groupby(filtered_products, key=itemgetter("category")):
-        # Limit to max_per_category products per category
-        grouped[key] = list(group)[:max_per_category]
+    parts = []
+    for category, products in grouped_products.items():
+        parts.append(f"<div class='category-header'>{html.escape(category)}</div>")
+        parts.extend(
+            "<div class='product-item'>"
+            f"<div class='product-name'>{html.escape(product['name'])}</div>"
+            f"<div class='product-brand'>{html.escape(product['brand'])}</div>"
+            f"<div class='product-color'>{html.escape(product['color'])}</div>"
+            "</div>"
+            for product in products
+        )
     
-    return grouped
-
-def get_unique_brands(product_list):
-    """Extract unique brands from products."""
-    brands = set()
-    for item in product_list:
-        if "error" not in item and "brand" in item:
-            brands.add(item["brand"])
-    return sorted(list(brands))
-
-def get_product_types(product_list):
-    """Extract unique product types from products."""
-    types = set()
-    for item in product_list:
-        if "error" not in item and "name" in item:
-            # Extract the product type (e.g., "Foundation" from "Foundation")
-            product_type = item["name"].split()[0].lower()
-            types.add(product_type)
-    return sorted(list(types))
+    filtered_count = sum(len(products) for products in grouped_products.values())
+    return "".join(parts), filtered_count
 
 # Initialize session state for filters if they don't exist
 if 'reset_filters' not in st.session_state:
@@ -205,26 +221,27 @@ if uploaded_file is not None:
     
     with col2:
         with st.spinner("Analyzing your skin tone..."):
-            cosmetics, proc_time = suggest_cosmetics_with_timing(uploaded_file)
+            skin_tone, proc_time, error = suggest_cosmetics_with_timing(uploaded_file.getvalue())
         
         if proc_time > 0:
             st.caption(f"Analysis completed in {proc_time:.2f} seconds")
     
-    has_error = False
-    for product in cosmetics:
-        if "error" in product:
-            st.error(f"😕 {product['error']}")
-            has_error = True
-            break
-    
-    if not has_error:
+    if error:
+        st.error(f"😕 {error}")
+    else:
         # Sidebar with filtering options
         with st.sidebar:
             st.header("Filter Results")
             
-            # Get unique values for filters
-            unique_brands = get_unique_brands(cosmetics)
-            product_types = get_product_types(cosmetics)
+            # Filter options are precomputed per skin tone
+            unique_brands = BRANDS_BY_TONE[skin_tone]
+            product_types = PRODUCT_TYPES_BY_TONE[skin_tone]
+            
+            # Read the saved filter state once for this rerun
+            ss = st.session_state
+            saved_brand = ss.selected_brand
+            saved_product_type = ss.selected_product_type
+            saved_products_per_category = ss.products_per_category
             
             # Product count selector
             st.subheader("Display Options")
@@ -232,18 +249,18 @@ if uploaded_file is not None:
                 "Products per category", 
                 min_value=1, 
                 max_value=10, 
-                value=st.session_state.products_per_category,
+                value=saved_products_per_category,
                 key="product_count_slider",
                 help="Select how many products to show in each category"
             )
-            st.session_state.products_per_category = products_per_category
+            ss.products_per_category = products_per_category
             
             # Brand filter
             st.subheader("Brand Filter")
             brands_list = ["All Brands"] + unique_brands
             brand_index = 0
-            if st.session_state.selected_brand != "All Brands" and st.session_state.selected_brand in unique_brands:
-                brand_index = brands_list.index(st.session_state.selected_brand)
+            if saved_brand != "All Brands" and saved_brand in unique_brands:
+                brand_index = brands_list.index(saved_brand)
             
             selected_brand = st.selectbox(
                 "Select a brand",
@@ -251,15 +268,15 @@ if uploaded_file is not None:
                 index=brand_index,
                 key="brand_selector"
             )
-            st.session_state.selected_brand = selected_brand
+            ss.selected_brand = selected_brand
             brand_filter = None if selected_brand == "All Brands" else selected_brand
             
             # Product type filter
             st.subheader("Product Type")
             types_list = ["All Products"] + product_types
             type_index = 0
-            if st.session_state.selected_product_type != "All Products" and st.session_state.selected_product_type in product_types:
-                type_index = types_list.index(st.session_state.selected_product_type)
+            if saved_product_type != "All Products" and saved_product_type in product_types:
+                type_index = types_list.index(saved_product_type)
                 
             selected_product_type = st.selectbox(
                 "Select product type",
@@ -267,7 +284,7 @@ if uploaded_file is not None:
                 index=type_index,
                 key="product_type_selector"
             )
-            st.session_state.selected_product_type = selected_product_type
+            ss.selected_product_type = selected_product_type
             product_type_filter = None if selected_product_type == "All Products" else selected_product_type
             
             # Reset filters button
@@ -289,17 +306,14 @@ if uploaded_file is not None:
             </div>
             """, unsafe_allow_html=True)
         
-        # Group and filter products
-        grouped_products = group_products_by_category(
-            cosmetics, 
-            max_per_category=products_per_category,
-            brand_filter=brand_filter,
-            product_type_filter=selected_product_type if selected_product_type != "All Products" else None
+        # Group, filter and render products
+        recommendations_html, filtered_count = render_recommendations_html(
+            skin_tone,
+            products_per_category,
+            brand_filter,
+            product_type_filter
         )
         
-        # Apply filters and show results
-        filtered_count = sum(len(products) for products in grouped_products.values())
-        
         # Display filter summary
         filter_summary = []
         if brand_filter:
@@ -315,19 +329,8 @@ if uploaded_file is not None:
         if filtered_count == 0:
             st.info("No products match your filter criteria. Try changing your filters.")
         else:
-            # Display products by category
-            for category, products in grouped_products.items():
-                if products:  # Only show categories with products
-                    st.markdown(f"<div class='category-header'>{category}</div>", unsafe_allow_html=True)
-                    
-                    for product in products:
-                        st.markdown(f"""
-                        <div class='product-item'>
-                            <div class='product-name'>{product['name']}</div>
-                            <div class='product-brand'>{product['brand']}</div>
-                            <div class='product-color'>{product['color']}</div>
-                        </div>
-                        """, unsafe_allow_html=True)
+            # Display all categories in a single markdown call
+            st.markdown(recommendations_html, unsafe_allow_html=True)
             
             st.success("These products were selected to complement your skin tone. Happy shopping! 🛍️")
 else:
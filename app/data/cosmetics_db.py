@@ -2,10 +2,13 @@
 Cosmetics database module.
 Contains the product recommendations database organized by skin tone.
 """
-from typing import Dict, List, Any
+from collections import defaultdict
+from operator import itemgetter
+from types import MappingProxyType
+from typing import Dict, List, Any, Mapping, Tuple
 
 # Define database of cosmetic products by skin tone
-COSMETIC_DATABASE: Dict[str, List[Dict[str, str]]] = {
+COSMETIC_DATABASE: Dict[str, List[Mapping[str, str]]] = {
     "fair": [
         # Face Products
         {"name": "Foundation", "brand": "Maybelline", "color": "Ivory"},
@@ -125,13 +128,77 @@ COSMETIC_DATABASE: Dict[str, List[Dict[str, str]]] = {
     ],
 }
 
-def get_product_by_category(skin_tone: str, category: str = None, brand: str = None, max_items: int = None) -> List[Dict[str, str]]:
+# Product names start with their product type, which determines the category
+FIRST_TOKEN_TO_CATEGORY: Dict[str, str] = {
+    "foundation": "Face Products",
+    "concealer": "Face Products",
+    "powder": "Face Products",
+    "blush": "Cheek Products",
+    "bronzer": "Cheek Products",
+    "highlighter": "Cheek Products",
+    "lipstick": "Lip Products",
+    "lip": "Lip Products",
+    "eyeshadow": "Eye Products",
+    "eyeliner": "Eye Products",
+    "mascara": "Eye Products",
+    "eyebrow": "Eye Products",
+}
+
+def _build_indexes() -> Dict[str, Dict[str, Dict[str, List[Mapping[str, str]]]]]:
+    """
+    Precompute derived product fields and the per-tone lookup indexes.
+    
+    Per-rerun filtering and grouping read the category, product type and
+    lowercased name directly instead of re-deriving them from the name.
+    Each product is then replaced by a read-only view, since every session
+    shares the same product objects.
+    
+    Returns:
+        Category and brand indexes for each skin tone
+    """
+    index = {}
+    for tone, products in COSMETIC_DATABASE.items():
+        by_category = defaultdict(list)
+        by_brand = defaultdict(list)
+        for i, product in enumerate(products):
+            name_lc = product["name"].lower()
+            product_type = name_lc.split()[0]
+            product["category"] = FIRST_TOKEN_TO_CATEGORY.get(product_type, "Other Products")
+            product["product_type"] = product_type
+            product["_name_lc"] = name_lc
+            products[i] = product = MappingProxyType(product)
+            by_category[product["category"]].append(product)
+            by_brand[product["brand"]].append(product)
+        index[tone] = {"by_category": dict(by_category), "by_brand": dict(by_brand)}
+    return index
+
+# Inverted indices by category and brand for each skin tone
+PRODUCT_INDEX: Dict[str, Dict[str, Dict[str, List[Mapping[str, str]]]]] = _build_indexes()
+
+# Shared immutable recommendation lists handed out by the prediction code,
+# sorted by category and name so grouping fills each category in that order
+PRODUCTS_BY_TONE: Dict[str, Tuple[Mapping[str, str], ...]] = {
+    tone: tuple(sorted(products, key=itemgetter("category", "name")))
+    for tone, products in COSMETIC_DATABASE.items()
+}
+
+# Sidebar filter options are static per skin tone, so derive them once
+BRANDS_BY_TONE: Dict[str, List[str]] = {
+    tone: sorted({p["brand"] for p in products})
+    for tone, products in COSMETIC_DATABASE.items()
+}
+PRODUCT_TYPES_BY_TONE: Dict[str, List[str]] = {
+    tone: sorted({p["product_type"] for p in products})
+    for tone, products in COSMETIC_DATABASE.items()
+}
+
+def get_product_by_category(skin_tone: str, category: str = None, brand: str = None, max_items: int = None) -> List[Mapping[str, str]]:
     """
     Get products filtered by skin tone, category and/or brand.
     
     Args:
         skin_tone: The skin tone to get products for ('fair', 'medium', 'dark')
-        category: Optional category filter
+        category: Optional category (e.g. 'Lip Products') or product name filter
         brand: Optional brand filter
         max_items: Optional limit on number of results
         
@@ -142,17 +209,27 @@ def get_product_by_category(skin_tone: str, category: str = None, brand: str = N
         return []
         
     products = COSMETIC_DATABASE[skin_tone]
+    index = PRODUCT_INDEX[skin_tone]
     
     # Apply category filter if specified
     if category:
-        products = [p for p in products if category.lower() in p["name"].lower()]
+        if category in index["by_category"]:
+            products = index["by_category"][category]
+        else:
+            # Not a category name; match it against product names instead
+            category_lc = category.lower()
+            products = [p for p in products if category_lc in p["_name_lc"]]
         
     # Apply brand filter if specified
     if brand:
-        products = [p for p in products if p["brand"] == brand]
+        if category:
+            products = [p for p in products if p["brand"] == brand]
+        else:
+            products = index["by_brand"].get(brand, [])
         
     # Apply limit if specified
     if max_items and max_items > 0:
         products = products[:max_items]
         
-    return products 
\ No newline at end of file
+    # Hand out a fresh list so callers cannot modify the shared indexes
+    return list(products) 
\ No newline at end of file
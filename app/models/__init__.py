@@ -1,3 +1,15 @@
 """
 Models package for AI-based skin tone analysis and makeup recommendations.
-""" 
\ No newline at end of file
+
+Environment defaults for DeepFace and TensorFlow are set here, so they are in
+place before any model module, or a warm-up thread, imports TensorFlow.
+"""
+import os
+
+# Set model directory to a writable location for Streamlit Cloud, unless the
+# deployment already points it at pre-downloaded weights
+os.environ.setdefault("DEEPFACE_HOME", "/tmp/.deepface")
+
+# Each Streamlit session analyzes on its own script thread; cap TensorFlow's
+# per-op threads so concurrent sessions do not oversubscribe the CPU cores
+os.environ.setdefault("TF_NUM_INTRAOP_THREADS", "2") 
\ No newline at end of file
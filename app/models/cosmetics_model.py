@@ -2,68 +2,118 @@
 Cosmetics prediction model handling.
 This module manages loading and using the DeepFace model for skin tone analysis.
 """
-import os
+import io
+import importlib.util
 import time
 import logging
 import numpy as np
 import random
+from types import MappingProxyType
 from PIL import Image
-from typing import Optional, Any, Dict, Tuple, List, Union
+from typing import Optional, Any, Dict, Mapping, Tuple, List, Sequence, Union
+
+from app.data.cosmetics_db import PRODUCTS_BY_TONE
+from app.models.race_model import SKIP_DETECTION_MIN_PROBABILITY, load_race_model, predict_race
+from app.utils.image_ops import resize_pil_to_max, rgb_to_bgr
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 # Type aliases for better code readability
-CosmeticProduct = Dict[str, str]
-CosmeticRecommendation = List[CosmeticProduct]
+CosmeticProduct = Mapping[str, str]
+CosmeticRecommendation = Sequence[CosmeticProduct]
 AnalysisResult = Union[CosmeticRecommendation, List[Dict[str, str]]]
+ImageInput = Union[Image.Image, np.ndarray]
+
+# Longest image side handed to the face analysis
+MAX_IMAGE_SIZE = 640
+
+# Minimum dominant race probability (percent) to accept a full-frame analysis
+# without running face detection first; DeepFace reports percentages
+SKIP_DETECTION_MIN_CONFIDENCE = SKIP_DETECTION_MIN_PROBABILITY * 100
 
-# Set model directory to a writable location for Streamlit Cloud
-os.environ["DEEPFACE_HOME"] = "/tmp/.deepface"
+# Mapping of DeepFace race categories to skin tones
+RACE_TO_SKIN_TONE = MappingProxyType({
+    "white": "fair",
+    "asian": "fair",
+    "middle eastern": "medium",
+    "latino hispanic": "medium",
+    "indian": "medium",
+    "black": "dark",
+})
+_MAP_SKIN_TONE = RACE_TO_SKIN_TONE.get
 
-# Check if we can use DeepFace
-DEEPFACE_AVAILABLE = False
+# Skin tones to pick from for mock predictions
+_SKIN_TONES = ("fair", "medium", "dark")
+
+# Private generator for mock predictions, kept apart from the global random state
+_RNG = random.Random()
+
+# OpenCV provides the vectorized color conversion and resize kernels
 try:
-    # Try to import TensorFlow first
-    import tensorflow as tf
-    # Try to import DeepFace
-    try:
-        from deepface import DeepFace
-        DEEPFACE_AVAILABLE = True
-        logger.info("DeepFace successfully imported and available for use")
-    except (ImportError, ValueError) as e:
-        logger.warning(f"DeepFace import error: {str(e)}")
-        DEEPFACE_AVAILABLE = False
-except (ImportError, ValueError) as e:
-    logger.warning(f"TensorFlow import error: {str(e)}")
-    DEEPFACE_AVAILABLE = False
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError as e:
+    logger.warning(f"OpenCV import error: {str(e)}")
+    CV2_AVAILABLE = False
 
-def mock_predict_cosmetics() -> CosmeticRecommendation:
+# Check if we can use DeepFace without importing it: TensorFlow alone takes
+# seconds to import, so DeepFace is only loaded on the first analysis
+DEEPFACE_AVAILABLE = all(
+    importlib.util.find_spec(name) is not None for name in ("tensorflow", "deepface")
+)
+if not DEEPFACE_AVAILABLE:
+    logger.warning("TensorFlow or DeepFace is not installed")
+
+def _import_deepface() -> bool:
     """
-    Generate mock cosmetics recommendations when DeepFace is unavailable.
+    Import DeepFace on first use, marking it unavailable if that fails.
     
     Returns:
-        List of recommended cosmetic products
+        bool: True if DeepFace can be used
+    """
+    global DEEPFACE_AVAILABLE
+    if DEEPFACE_AVAILABLE:
+        try:
+            from deepface import DeepFace  # noqa: F401
+        except (ImportError, ValueError) as e:
+            # An installed but broken TensorFlow counts as no DeepFace
+            logger.warning(f"TensorFlow or DeepFace import error: {str(e)}")
+            DEEPFACE_AVAILABLE = False
+    return DEEPFACE_AVAILABLE
+
+def mock_predict_skin_tone() -> str:
     """
-    from app.data.cosmetics_db import COSMETIC_DATABASE
+    Pick a random skin tone when DeepFace is unavailable.
     
+    Returns:
+        str: Skin tone category ('fair', 'medium', or 'dark')
+    """
     # Choose a random skin tone for mock predictions
-    skin_tones = ["fair", "medium", "dark"]
-    selected_tone = random.choice(skin_tones)
+    selected_tone = _RNG.choice(_SKIN_TONES)
     
     logger.info(f"Using mock predictions with skin tone: {selected_tone}")
     
-    return COSMETIC_DATABASE[selected_tone]
+    return selected_tone
+
+def mock_predict_cosmetics() -> CosmeticRecommendation:
+    """
+    Generate mock cosmetics recommendations when DeepFace is unavailable.
+    
+    Returns:
+        List of recommended cosmetic products
+    """
+    return PRODUCTS_BY_TONE[mock_predict_skin_tone()]
 
 def load_model() -> Optional[Any]:
     """
     Load the skin tone analysis model.
     
     Returns:
-        Optional[Any]: Model instance or None if no specific model is required
+        Optional[Any]: Race classifier, or None to use DeepFace.analyze
     """
     logger.info("Loading model...")
-    return None  # DeepFace doesn't require pre-loading a model
+    return load_race_model()
 
 def convert_pil_to_cv2(pil_image: Image.Image) -> np.ndarray:
     """
@@ -75,17 +125,96 @@ def convert_pil_to_cv2(pil_image: Image.Image) -> np.ndarray:
     Returns:
         OpenCV-compatible numpy array
     """
-    # Convert PIL image to numpy array (RGB)
-    rgb_image = np.array(pil_image)
+    # Convert PIL image to numpy array (RGB) without a defensive copy
+    rgb_image = np.asarray(pil_image)
     
     # Convert RGB to BGR (OpenCV format)
     if rgb_image.ndim == 3 and rgb_image.shape[2] == 3:  # Check if it's a color image
-        bgr_image = rgb_image[:, :, ::-1].copy()  # Reverse the channels (RGB to BGR)
-        return bgr_image
+        if CV2_AVAILABLE:
+            # Single SIMD pass into a fresh contiguous buffer
+            return cv2.cvtColor(rgb_image, cv2.COLOR_RGB2BGR)
+        return rgb_to_bgr(rgb_image)
     
     # For grayscale images or other formats, return as is
     return rgb_image
 
+def _reduced_decode_flag(image_bytes: bytes, max_size: int) -> int:
+    """
+    Pick the largest OpenCV reduced-resolution decode that stays above max_size.
+    
+    Args:
+        image_bytes: Encoded image data
+        max_size: Target size of the longest image side
+        
+    Returns:
+        cv2.imread flag to decode with
+    """
+    try:
+        # PIL only parses the header here; no pixel data is decoded
+        with Image.open(io.BytesIO(image_bytes)) as header:
+            longest_side = max(header.size)
+    except Exception:
+        return cv2.IMREAD_COLOR
+    
+    for factor, flag in (
+        (8, cv2.IMREAD_REDUCED_COLOR_8),
+        (4, cv2.IMREAD_REDUCED_COLOR_4),
+        (2, cv2.IMREAD_REDUCED_COLOR_2),
+    ):
+        if longest_side // factor >= max_size:
+            return flag
+    return cv2.IMREAD_COLOR
+
+def _resize_to_max(image_cv: np.ndarray, max_size: int) -> np.ndarray:
+    """
+    Downscale an OpenCV image so its longest side is at most max_size.
+    
+    Args:
+        image_cv: OpenCV-compatible numpy array
+        max_size: Maximum size of the longest image side
+        
+    Returns:
+        The resized array, or the input itself when already small enough
+    """
+    h, w = image_cv.shape[:2]
+    if h <= max_size and w <= max_size:
+        return image_cv
+    
+    scale = max_size / max(h, w)
+    new_size = (int(w * scale), int(h * scale))
+    logger.info(f"Resized image from {w}x{h} to {new_size[0]}x{new_size[1]}")
+    # Area averaging is both faster and sharper than bilinear when shrinking
+    return cv2.resize(image_cv, new_size, interpolation=cv2.INTER_AREA)
+
+def decode_image_bytes(image_bytes: bytes, max_size: int = MAX_IMAGE_SIZE) -> np.ndarray:
+    """
+    Decode raw image bytes into a BGR array no larger than max_size.
+    
+    JPEG images are decoded at a reduced 1/2, 1/4 or 1/8 scale when they are
+    much larger than max_size, using libjpeg's DCT-domain scaling. Any
+    remaining downscale happens here too, so callers only ever hold a single
+    analysis-sized array.
+    
+    Args:
+        image_bytes: Encoded image data (JPEG, PNG, ...)
+        max_size: Target size of the longest image side
+        
+    Returns:
+        OpenCV-compatible numpy array
+    """
+    if CV2_AVAILABLE:
+        image_cv = cv2.imdecode(
+            np.frombuffer(image_bytes, np.uint8),
+            _reduced_decode_flag(image_bytes, max_size)
+        )
+        if image_cv is None:
+            raise ValueError("Unable to decode the uploaded image")
+        return _resize_to_max(image_cv, max_size)
+    
+    # Fall back to PIL when OpenCV is unavailable
+    pil_image = resize_pil_to_max(Image.open(io.BytesIO(image_bytes)), max_size)
+    return convert_pil_to_cv2(pil_image.convert("RGB"))
+
 def map_skin_tone(dominant_race: str) -> str:
     """
     Maps the DeepFace race category to our simplified skin tone categories.
@@ -96,104 +225,129 @@ def map_skin_tone(dominant_race: str) -> str:
     Returns:
         str: Mapped skin tone category ('fair', 'medium', or 'dark')
     """
-    # Mapping of race categories to skin tones
-    RACE_TO_SKIN_TONE = {
-        "white": "fair",
-        "asian": "fair",
-        "middle eastern": "medium",
-        "latino hispanic": "medium",
-        "indian": "medium",
-        "black": "dark",
-    }
-    return RACE_TO_SKIN_TONE.get(dominant_race.lower(), "medium")
+    return _MAP_SKIN_TONE(dominant_race.lower(), "medium")
 
-def predict_cosmetics(model: Optional[Any], image: Image.Image) -> AnalysisResult:
+def _analyze_race(image_cv: np.ndarray, detector_backend: str) -> Dict[str, Any]:
     """
-    Analyze skin tone and suggest cosmetics.
+    Run DeepFace race analysis with the given face detector.
     
     Args:
-        model: Unused in this implementation
-        image: PIL Image containing a face
+        image_cv: OpenCV-compatible numpy array
+        detector_backend: DeepFace detector backend name
         
     Returns:
-        List of recommended cosmetic products or error message
+        DeepFace analysis result for the first face
     """
-    from app.data.cosmetics_db import COSMETIC_DATABASE
+    from deepface import DeepFace
     
-    if not DEEPFACE_AVAILABLE:
-        logger.warning("DeepFace not available. Using random skin tone recommendations.")
-        return mock_predict_cosmetics()
+    return DeepFace.analyze(
+        image_cv, 
+        actions=['race'], 
+        enforce_detection=False,
+        detector_backend=detector_backend,
+        silent=True
+    )[0]
+
+def predict_skin_tone(model: Optional[Any], image: ImageInput) -> str:
+    """
+    Analyze the skin tone of the face in an image.
     
-    try:
-        # Convert PIL Image to OpenCV format
-        image_cv = convert_pil_to_cv2(image)
+    Args:
+        model: Race classifier from load_model(), or None to use DeepFace
+        image: PIL Image (resized in place, ideally not yet loaded so JPEGs
+            can be decoded at reduced size) or BGR numpy array from
+            decode_image_bytes containing a face
         
-        # Make sure image is not too large to avoid memory issues
-        max_size = 800
-        h, w = image_cv.shape[:2]
-        if h > max_size or w > max_size:
-            scale = max_size / max(h, w)
-            new_size = (int(w * scale), int(h * scale))
-            # Import OpenCV in a try block to handle import errors
-            try:
-                import cv2
-                image_cv = cv2.resize(image_cv, new_size)  # type: ignore
-                logger.info(f"Resized image from {w}x{h} to {new_size[0]}x{new_size[1]}")
-            except (ImportError, AttributeError):
-                # If resize fails, just use the original image
-                logger.warning("Image resize failed. Using original image.")
+    Returns:
+        str: Skin tone category ('fair', 'medium', or 'dark')
         
-        # Analyze face attributes with more robust error handling
-        try:
-            # Try with default detection
-            result = DeepFace.analyze(
-                image_cv, 
-                actions=['race'], 
-                enforce_detection=False,
-                detector_backend='opencv',
-                silent=True
-            )
-            
-            dominant_race = result[0]['dominant_race']
-            skin_tone = map_skin_tone(dominant_race)
-            
-            # Free up memory
-            import gc
-            gc.collect()
-            
-            return COSMETIC_DATABASE[skin_tone]
-            
-        except Exception as inner_e:
-            logger.warning(f"DeepFace analysis failed: {str(inner_e)}")
-            # Fall back to mock predictions if DeepFace fails
-            return mock_predict_cosmetics()
+    Raises:
+        Exception: If the image cannot be analyzed; random mock tones are only
+            used when neither a classifier nor DeepFace is available, so
+            failures are never mistaken for real (and cacheable) results
+    """
+    if model is None and not _import_deepface():
+        logger.warning("DeepFace not available. Using random skin tone recommendations.")
+        return mock_predict_skin_tone()
+    
+    # Downscale PIL images before converting them to OpenCV format; arrays
+    # are already BGR and sized by decode_image_bytes
+    if isinstance(image, np.ndarray):
+        image_cv = image
+    else:
+        pil_image = resize_pil_to_max(image, MAX_IMAGE_SIZE)
+        if pil_image.mode != "RGB":
+            pil_image = pil_image.convert("RGB")
+        image_cv = convert_pil_to_cv2(pil_image)
+    
+    # A loaded race classifier bypasses DeepFace.analyze entirely
+    if model is not None:
+        return map_skin_tone(predict_race(model, image_cv))
+    
+    # Selfies are mostly face, so try the whole frame without detection
+    result = _analyze_race(image_cv, 'skip')
+    if max(result['race'].values()) < SKIP_DETECTION_MIN_CONFIDENCE:
+        # Low confidence suggests the face does not fill the frame
+        result = _analyze_race(image_cv, 'opencv')
+    
+    return map_skin_tone(result['dominant_race'])
 
-    except Exception as e:
-        logger.error(f"Face analysis failed: {str(e)}")
-        # In case of error, use mock predictions
-        return mock_predict_cosmetics()
+def predict_cosmetics(model: Optional[Any], image: ImageInput) -> AnalysisResult:
+    """
+    Analyze skin tone and suggest cosmetics.
+    
+    Args:
+        model: Race classifier from load_model(), or None to use DeepFace
+        image: PIL Image or BGR numpy array containing a face
+        
+    Returns:
+        List of recommended cosmetic products
+        
+    Raises:
+        Exception: If the image cannot be analyzed
+    """
+    return PRODUCTS_BY_TONE[predict_skin_tone(model, image)]
 
-def analyze_image_with_timing(image: Image.Image) -> Tuple[AnalysisResult, float]:
+def analyze_skin_tone_with_timing(
+    image: ImageInput, model: Optional[Any] = None
+) -> Tuple[Optional[str], float, Optional[str]]:
     """
-    Process image and suggest cosmetics with timing.
+    Analyze skin tone with timing.
     
     Args:
-        image: PIL Image to analyze
+        image: PIL Image or BGR numpy array to analyze
+        model: Race classifier from load_model(), or None to use DeepFace
         
     Returns:
-        Tuple of (cosmetic recommendations, processing time in seconds)
+        Tuple of (skin tone category, processing time in seconds, error
+        message); the skin tone is None when the error message is set
     """
     try:
         start_time = time.time()
-        
-        # Call predict_cosmetics directly with None as model
-        predictions = predict_cosmetics(None, image)
-        
+        skin_tone = predict_skin_tone(model, image)
         processing_time = time.time() - start_time
-        logger.info("Prediction completed in %.2f seconds", processing_time)
+        logger.info("Skin tone analysis completed in %.2f seconds", processing_time)
         
-        return predictions, processing_time
+        return skin_tone, processing_time, None
     except Exception as e:
-        logger.error("Error in cosmetic suggestion: %s", str(e))
-        # In case of error, use mock predictions
-        return mock_predict_cosmetics(), 0 
\ No newline at end of file
+        logger.error("Error in skin tone analysis: %s", str(e))
+        return None, 0, f"Processing failed: {str(e)}"
+
+def analyze_image_with_timing(
+    image: Image.Image, model: Optional[Any] = None
+) -> Tuple[CosmeticRecommendation, float, Optional[str]]:
+    """
+    Process image and suggest cosmetics with timing.
+    
+    Args:
+        image: PIL Image to analyze
+        model: Race classifier from load_model(), or None to use DeepFace
+        
+    Returns:
+        Tuple of (cosmetic recommendations, processing time in seconds, error
+        message); recommendations are empty when the error message is set
+    """
+    skin_tone, processing_time, error = analyze_skin_tone_with_timing(image, model)
+    if error:
+        return (), 0, error
+    return PRODUCTS_BY_TONE[skin_tone], processing_time, None 
\ No newline at end of file
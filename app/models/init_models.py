@@ -1,47 +1,100 @@
 """
-Model initialization module for handling DeepFace model downloads.
+Model initialization module for loading and warming up the analysis models.
 """
-import os
 import logging
+import threading
 import numpy as np
 import streamlit as st
+from typing import Optional
+
+from app.models.race_model import RaceClassifier, get_face_detector, load_race_model, predict_race
+from app.utils.image_ops import warm_up_image_ops
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Set model directory to a writable location for Streamlit Cloud
-os.environ["DEEPFACE_HOME"] = "/tmp/.deepface"
+def _warm_up_deepface() -> None:
+    """Run a tiny DeepFace analysis so model weights are downloaded and built."""
+    # Import DeepFace here to allow setting environment variables first
+    from deepface import DeepFace
+    
+    # Create a small dummy image to trigger model downloads
+    dummy_img = np.zeros((100, 100, 3), dtype=np.uint8)
+    DeepFace.analyze(
+        dummy_img, 
+        actions=['race'], 
+        enforce_detection=False, 
+        detector_backend='opencv',
+        silent=True
+    )
+
+@st.cache_resource
+def get_race_model() -> Optional[RaceClassifier]:
+    """
+    Load the race classifier once per server process.
+    
+    Returns:
+        Optional[RaceClassifier]: Classifier, or None to use DeepFace.analyze
+    """
+    return load_race_model()
+
+def warm_up_models() -> None:
+    """Load the models the first analysis needs and run them once."""
+    # Loading the classifier downloads the weights it needs
+    race_model = get_race_model()
+    if race_model is None:
+        _warm_up_deepface()
+    else:
+        # Load the face detector and build the model's inference graph
+        # with one dummy prediction, so the first upload pays neither
+        get_face_detector()
+        predict_race(race_model, np.zeros((100, 100, 3), dtype=np.uint8))
+
+@st.cache_resource
+def start_background_warmup() -> threading.Thread:
+    """
+    Start preloading the analysis models on a background thread.
+    This overlaps model loading with the user choosing a photo.
+    
+    Returns:
+        threading.Thread: The warm-up thread, which callers can join
+    """
+    def run_warmup() -> None:
+        try:
+            warm_up_models()
+            logger.info("Models warmed up in the background")
+        except Exception as e:
+            logger.warning(f"Background model warm-up warning: {str(e)}")
+    
+    thread = threading.Thread(target=run_warmup, name="model-warmup", daemon=True)
+    thread.start()
+    return thread
 
 @st.cache_resource
 def initialize_models():
     """
-    Initialize and preload DeepFace models.
+    Initialize and preload the face analysis models.
     This helps avoid timeouts during the first use.
     
     Returns:
         bool: True if initialization was successful
     """
-    logger.info("Initializing DeepFace models...")
+    logger.info("Initializing face analysis models...")
+    
+    # Compile the OpenCV-free image kernels ahead of the first upload
+    from app.models.cosmetics_model import CV2_AVAILABLE
+    if not CV2_AVAILABLE:
+        warm_up_image_ops()
     
     try:
-        # Import DeepFace here to allow setting environment variables first
-        from deepface import DeepFace
-        
-        # Create a small dummy image to trigger model downloads
         with st.spinner("Setting up face analysis models (first run only)..."):
-            dummy_img = np.zeros((100, 100, 3), dtype=np.uint8)
-            # Set a short timeout for the operation
-            DeepFace.analyze(
-                dummy_img, 
-                actions=['race'], 
-                enforce_detection=False, 
-                detector_backend='opencv',
-                silent=True
-            )
+            # Reuse a warm-up started from the welcome screen, or start one;
+            # it only pulls in DeepFace when no race classifier loads
+            start_background_warmup().join()
         
-        logger.info("DeepFace models initialized successfully")
+        logger.info("Face analysis models initialized successfully")
         return True
     except Exception as e:
-        logger.warning(f"DeepFace model initialization warning: {str(e)}")
+        logger.warning(f"Model initialization warning: {str(e)}")
         # Return True anyway to not block the app
         return True 
\ No newline at end of file
@@ -0,0 +1,465 @@
+"""
+Race classifier used in place of DeepFace.analyze.
+This module loads an int8-quantized ONNX or TFLite export of DeepFace's race
+model, avoiding the full TensorFlow runtime on the hot path. Without an
+export it calls DeepFace's Keras model directly, skipping DeepFace.analyze's
+per-call detector and action dispatch.
+
+Create the model once, offline, with:
+
+    python -m app.models.race_model [output_path] [calibration_image_dir]
+
+Output paths ending in .tflite produce a TFLite model, anything else ONNX.
+"""
+import os
+import time
+import queue
+import logging
+import tempfile
+import threading
+import numpy as np
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Type alias for a loaded classifier: (N, H, W, 3) float32 batch -> (N, 6) probabilities
+RaceClassifier = Callable[[np.ndarray], np.ndarray]
+
+# Output order of DeepFace's race model
+RACE_LABELS = ("asian", "indian", "black", "white", "middle eastern", "latino hispanic")
+
+# Input resolution of DeepFace's race model
+RACE_INPUT_SIZE = 224
+
+# Minimum top-class probability to accept a whole-frame prediction without
+# detecting and cropping the face first
+SKIP_DETECTION_MIN_PROBABILITY = 0.6
+
+# Location of the quantized model, overridable for deployments
+DEFAULT_RACE_MODEL_PATH = os.path.join(os.path.dirname(__file__), "race_int8.onnx")
+
+# Lightweight MobileNet race classifier, preferred over the DeepFace export
+# when bundled; it takes the same [0, 1] scaled BGR faces with the same labels
+MOBILENET_RACE_MODEL_PATH = os.path.join(os.path.dirname(__file__), "race_mobilenet.tflite")
+
+RACE_MODEL_PATH = os.environ.get(
+    "RACE_MODEL_PATH",
+    MOBILENET_RACE_MODEL_PATH if os.path.exists(MOBILENET_RACE_MODEL_PATH) else DEFAULT_RACE_MODEL_PATH,
+)
+
+# Coalesce concurrent predictions into one forward pass; only pays off when
+# several sessions analyze photos at the same time, so it is opt-in
+MICROBATCH_ENABLED = os.environ.get("RACE_MICROBATCH", "0") == "1"
+MICROBATCH_WINDOW_SECONDS = 0.02
+MICROBATCH_MAX_SIZE = 16
+
+# OpenCV Haar cascade used to crop faces, matching DeepFace's 'opencv' detector
+FACE_CASCADE_FILE = "haarcascade_frontalface_default.xml"
+
+# OpenCV is needed to prepare model inputs
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError as e:
+    logger.warning(f"OpenCV import error: {str(e)}")
+    CV2_AVAILABLE = False
+
+# Prefer the slim TFLite runtime over full TensorFlow for .tflite models
+try:
+    from tflite_runtime.interpreter import Interpreter as TFLiteInterpreter
+except ImportError:
+    TFLiteInterpreter = None
+
+# Check if we can use ONNX Runtime
+try:
+    import onnxruntime as ort
+    ONNXRUNTIME_AVAILABLE = True
+    # Only says the CUDA provider is built in; sessions confirm a usable GPU
+    ONNX_CUDA_AVAILABLE = "CUDAExecutionProvider" in ort.get_available_providers()
+except ImportError as e:
+    logger.info(f"ONNX Runtime not available: {str(e)}")
+    ONNXRUNTIME_AVAILABLE = False
+    ONNX_CUDA_AVAILABLE = False
+
+def preprocess_face(image_cv: np.ndarray, target_size: int = RACE_INPUT_SIZE) -> np.ndarray:
+    """
+    Prepare a BGR image the way DeepFace prepares faces for the race model.
+
+    The image is resized to fit target_size while keeping its aspect ratio,
+    zero-padded to a square and scaled to [0, 1].
+
+    Args:
+        image_cv: OpenCV-compatible BGR numpy array
+        target_size: Model input resolution
+
+    Returns:
+        Float32 batch of shape (1, target_size, target_size, 3)
+    """
+    h, w = image_cv.shape[:2]
+    factor = min(target_size / h, target_size / w)
+    new_w, new_h = max(1, int(w * factor)), max(1, int(h * factor))
+    resized = cv2.resize(image_cv, (new_w, new_h), interpolation=cv2.INTER_AREA)
+
+    batch = np.zeros((1, target_size, target_size, 3), dtype=np.float32)
+    top, left = (target_size - new_h) // 2, (target_size - new_w) // 2
+    batch[0, top:top + new_h, left:left + new_w] = resized
+    batch /= 255.0
+    return batch
+
+@lru_cache(maxsize=1)
+def get_face_detector() -> Any:
+    """Load the Haar cascade face detector once per process."""
+    return cv2.CascadeClassifier(os.path.join(cv2.data.haarcascades, FACE_CASCADE_FILE))
+
+def crop_face(image_cv: np.ndarray) -> np.ndarray:
+    """
+    Crop the largest detected face from a BGR image.
+
+    Args:
+        image_cv: OpenCV-compatible BGR numpy array
+
+    Returns:
+        View of the face region, or the whole image when no face is found
+    """
+    gray = cv2.cvtColor(image_cv, cv2.COLOR_BGR2GRAY)
+    faces = get_face_detector().detectMultiScale(gray, scaleFactor=1.1, minNeighbors=10)
+    if len(faces) == 0:
+        return image_cv
+
+    x, y, w, h = max(faces, key=lambda face: face[2] * face[3])
+    return image_cv[y:y + h, x:x + w]
+
+def load_onnx_race_model(path: str, use_gpu: bool = False) -> RaceClassifier:
+    """
+    Load an ONNX race model into an ONNX Runtime session.
+
+    Args:
+        path: Path to the .onnx file
+        use_gpu: Run the session on CUDA
+
+    Returns:
+        RaceClassifier: Function mapping an input batch to class probabilities
+
+    Raises:
+        RuntimeError: If use_gpu is set but the session fell back to the CPU
+    """
+    # Enable layout and kernel fusions on top of the basic constant folding
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    providers = ["CPUExecutionProvider"]
+    if use_gpu:
+        providers.insert(0, "CUDAExecutionProvider")
+    session = ort.InferenceSession(path, sess_options=options, providers=providers)
+    # ONNX Runtime silently drops CUDA when no device or driver is usable
+    if use_gpu and "CUDAExecutionProvider" not in session.get_providers():
+        raise RuntimeError("CUDA execution provider failed to initialize")
+    input_name = session.get_inputs()[0].name
+
+    def classify(batch: np.ndarray) -> np.ndarray:
+        return session.run(None, {input_name: batch})[0]
+
+    return classify
+
+def load_tflite_race_model(path: str) -> RaceClassifier:
+    """
+    Load a TFLite race model into an interpreter.
+
+    Args:
+        path: Path to the .tflite file
+
+    Returns:
+        RaceClassifier: Function mapping an input batch to class probabilities
+    """
+    interpreter_cls = TFLiteInterpreter
+    if interpreter_cls is None:
+        import tensorflow as tf
+        interpreter_cls = tf.lite.Interpreter
+
+    interpreter = interpreter_cls(model_path=path)
+    interpreter.allocate_tensors()
+    input_details = interpreter.get_input_details()[0]
+    input_index = input_details["index"]
+    output_index = interpreter.get_output_details()[0]["index"]
+    # Interpreters hold per-invocation state and are not thread-safe
+    lock = threading.Lock()
+
+    def classify(batch: np.ndarray) -> np.ndarray:
+        with lock:
+            if tuple(interpreter.get_input_details()[0]["shape"]) != batch.shape:
+                interpreter.resize_tensor_input(input_index, batch.shape)
+                interpreter.allocate_tensors()
+            interpreter.set_tensor(input_index, batch)
+            interpreter.invoke()
+            return interpreter.get_tensor(output_index).copy()
+
+    # Smaller backbones may expect a lower input resolution
+    classify.input_size = int(input_details["shape"][1])
+    return classify
+
+def load_keras_race_model() -> RaceClassifier:
+    """
+    Load DeepFace's Keras race model for direct prediction.
+
+    Returns:
+        RaceClassifier: Function mapping an input batch to class probabilities
+    """
+    keras_model = _build_deepface_race_model()
+
+    def classify(batch: np.ndarray) -> np.ndarray:
+        return keras_model.predict(batch, verbose=0)
+
+    return classify
+
+def make_batched_classifier(
+    model: RaceClassifier,
+    window: float = MICROBATCH_WINDOW_SECONDS,
+    max_batch_size: int = MICROBATCH_MAX_SIZE,
+) -> RaceClassifier:
+    """
+    Wrap a classifier so concurrent calls share a single forward pass.
+
+    Requests arriving within window seconds of the first one are stacked into
+    one batch on a background thread, and each caller receives its own rows.
+
+    Args:
+        model: Classifier to wrap
+        window: Seconds to wait for more requests after the first arrives
+        max_batch_size: Maximum number of requests per forward pass
+
+    Returns:
+        RaceClassifier: Thread-safe classifier with the same signature
+    """
+    pending: "queue.Queue[Tuple[np.ndarray, Future]]" = queue.Queue()
+
+    def run_batches() -> None:
+        while True:
+            requests: List[Tuple[np.ndarray, Future]] = [pending.get()]
+            deadline = time.monotonic() + window
+            while len(requests) < max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    requests.append(pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                probabilities = model(np.concatenate([batch for batch, _ in requests]))
+            except Exception as e:
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for batch, future in requests:
+                future.set_result(probabilities[offset:offset + len(batch)])
+                offset += len(batch)
+
+    threading.Thread(target=run_batches, name="race-microbatch", daemon=True).start()
+
+    def classify(batch: np.ndarray) -> np.ndarray:
+        future: Future = Future()
+        pending.put((batch, future))
+        return future.result()
+
+    classify.input_size = getattr(model, "input_size", RACE_INPUT_SIZE)
+    return classify
+
+def _gpu_race_model_path() -> str:
+    """Location of the cached fp32 export used on GPUs."""
+    deepface_home = os.environ.get("DEEPFACE_HOME", os.path.expanduser("~"))
+    return os.path.join(deepface_home, ".deepface", "onnx", "race.onnx")
+
+def load_gpu_race_model() -> Optional[RaceClassifier]:
+    """
+    Load the fp32 race model on the GPU, exporting it on first use.
+
+    Returns:
+        Optional[RaceClassifier]: Classifier, or None if no GPU session could be created
+    """
+    gpu_path = _gpu_race_model_path()
+    try:
+        if not os.path.exists(gpu_path):
+            # Export beside the cache and rename, so a failed conversion
+            # never leaves a truncated model behind for later runs
+            partial_path = f"{gpu_path}.{os.getpid()}.partial"
+            try:
+                export_onnx_race_model(partial_path)
+                os.replace(partial_path, gpu_path)
+            finally:
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+        model = load_onnx_race_model(gpu_path, use_gpu=True)
+        logger.info(f"Loaded race model from {gpu_path} on the GPU")
+        return model
+    except Exception as e:
+        logger.warning(f"GPU race model unavailable, using the CPU: {str(e)}")
+        return None
+
+def load_race_model(path: str = RACE_MODEL_PATH) -> Optional[RaceClassifier]:
+    """
+    Load the quantized race classifier, or DeepFace's Keras model without it.
+
+    Args:
+        path: Path to the quantized model
+
+    Returns:
+        Optional[RaceClassifier]: Classifier, or None to fall back to DeepFace.analyze
+    """
+    if not CV2_AVAILABLE:
+        return None
+
+    try:
+        model = None
+        if path.endswith(".tflite") and os.path.exists(path):
+            model = load_tflite_race_model(path)
+            logger.info(f"Loaded race model from {path}")
+        elif ONNX_CUDA_AVAILABLE and (path == DEFAULT_RACE_MODEL_PATH or not os.path.exists(path)):
+            # Dynamically quantized int8 ops run on the CPU, so GPUs get an
+            # fp32 export, converted on first use and cached with DeepFace's weights
+            model = load_gpu_race_model()
+
+        if model is None:
+            if ONNXRUNTIME_AVAILABLE and os.path.exists(path):
+                model = load_onnx_race_model(path)
+                logger.info(f"Loaded race model from {path}")
+            else:
+                model = load_keras_race_model()
+                logger.info("Loaded DeepFace Keras race model")
+        if MICROBATCH_ENABLED:
+            model = make_batched_classifier(model)
+        return model
+    except Exception as e:
+        logger.warning(f"Race model load error: {str(e)}")
+        return None
+
+def predict_race(model: RaceClassifier, image_cv: np.ndarray) -> str:
+    """
+    Classify the dominant race of the face in an image.
+
+    The whole frame is classified first; the face detector only runs when
+    that prediction is not confident enough.
+
+    Args:
+        model: Classifier returned by load_race_model
+        image_cv: OpenCV-compatible BGR numpy array containing a face
+
+    Returns:
+        str: Race label in DeepFace's naming
+    """
+    target_size = getattr(model, "input_size", RACE_INPUT_SIZE)
+
+    # Selfies are mostly face, so try the whole frame without detection
+    probabilities = model(preprocess_face(image_cv, target_size))[0]
+    if probabilities.max() < SKIP_DETECTION_MIN_PROBABILITY:
+        # Low confidence suggests the face does not fill the frame
+        face = crop_face(image_cv)
+        if face is not image_cv:
+            probabilities = model(preprocess_face(face, target_size))[0]
+    return RACE_LABELS[int(np.argmax(probabilities))]
+
+def _build_deepface_race_model() -> Any:
+    """Build DeepFace's Keras race model, across DeepFace API versions."""
+    from deepface import DeepFace
+
+    try:
+        client = DeepFace.build_model(model_name="Race", task="facial_attribute")
+    except TypeError:
+        client = DeepFace.build_model("Race")
+    # Newer DeepFace versions wrap the Keras model in a client object
+    return getattr(client, "model", client)
+
+def export_onnx_race_model(output_path: str) -> str:
+    """
+    Export DeepFace's race model to ONNX in fp32.
+
+    Requires TensorFlow, DeepFace and tf2onnx.
+
+    Args:
+        output_path: Where to write the model
+
+    Returns:
+        str: The output path
+    """
+    import tensorflow as tf
+    import tf2onnx
+
+    input_signature = (
+        tf.TensorSpec((None, RACE_INPUT_SIZE, RACE_INPUT_SIZE, 3), tf.float32, name="input"),
+    )
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    tf2onnx.convert.from_keras(
+        _build_deepface_race_model(), input_signature=input_signature, opset=17, output_path=output_path
+    )
+    return output_path
+
+def export_quantized_race_model(output_path: str = DEFAULT_RACE_MODEL_PATH) -> str:
+    """
+    Export DeepFace's race model to ONNX with dynamic int8 weight quantization.
+
+    Requires TensorFlow, DeepFace, tf2onnx and onnxruntime; meant to run once
+    at build time rather than in the app.
+
+    Args:
+        output_path: Where to write the quantized model
+
+    Returns:
+        str: The output path
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fp32_path = export_onnx_race_model(os.path.join(tmp_dir, "race_fp32.onnx"))
+        quantize_dynamic(fp32_path, output_path, weight_type=QuantType.QInt8)
+
+    logger.info(f"Exported quantized race model to {output_path}")
+    return output_path
+
+def _calibration_batches(image_dir: str) -> Iterator[List[np.ndarray]]:
+    """Yield preprocessed face batches from a directory of photos."""
+    for name in sorted(os.listdir(image_dir)):
+        image_cv = cv2.imread(os.path.join(image_dir, name))
+        if image_cv is not None:
+            yield [preprocess_face(crop_face(image_cv))]
+
+def export_tflite_race_model(output_path: str, calibration_dir: Optional[str] = None) -> str:
+    """
+    Export DeepFace's race model to TFLite with int8 quantization.
+
+    With a directory of face photos for calibration, weights and activations
+    are quantized to int8; without one, only the weights are. Inputs and
+    outputs stay float32 either way, so callers are unaffected.
+
+    Args:
+        output_path: Where to write the .tflite model
+        calibration_dir: Optional directory of representative face photos
+
+    Returns:
+        str: The output path
+    """
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(_build_deepface_race_model())
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if calibration_dir:
+        converter.representative_dataset = lambda: _calibration_batches(calibration_dir)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+    with open(output_path, "wb") as f:
+        f.write(converter.convert())
+
+    logger.info(f"Exported TFLite race model to {output_path}")
+    return output_path
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) > 1 and sys.argv[1].endswith(".tflite"):
+        export_tflite_race_model(*sys.argv[1:3])
+    else:
+        export_quantized_race_model(*sys.argv[1:2])
@@ -1,9 +1,25 @@
 """
 Reusable UI components for the application.
 """
+import html
 import streamlit as st
 from typing import Dict, List, Any, Optional, Callable
-from app.ui.styles import LINKEDIN_PROFILE_HTML, SAMPLE_CATEGORIES
+from app.ui.styles import LINKEDIN_PROFILE_HTML, MAIN_STYLES, SAMPLE_CATEGORIES
+
+@st.cache_resource
+def get_styles_html() -> str:
+    """Return the stylesheet markup, built once per server process."""
+    return MAIN_STYLES
+
+def inject_styles() -> None:
+    """
+    Apply the custom stylesheet.
+    
+    Streamlit drops elements a rerun does not emit again, so this must run on
+    every rerun; the markup is identical each time, letting the frontend reuse
+    the existing element instead of re-rendering it.
+    """
+    st.markdown(get_styles_html(), unsafe_allow_html=True)
 
 def display_sidebar_info() -> None:
     """Display about information in the sidebar."""
@@ -24,18 +40,16 @@ def display_sidebar_info() -> None:
     st.sidebar.markdown(LINKEDIN_PROFILE_HTML, unsafe_allow_html=True)
 
 def display_filter_sidebar(
-    cosmetics: List[Dict[str, str]],
-    get_brands_func: Callable[[List[Dict[str, str]]], List[str]],
-    get_types_func: Callable[[List[Dict[str, str]]], List[str]],
+    unique_brands: List[str],
+    product_types: List[str],
     reset_func: Callable[[], None]
 ) -> Dict[str, Any]:
     """
     Display filter controls in the sidebar.
     
     Args:
-        cosmetics: List of cosmetic products
-        get_brands_func: Function to extract unique brands
-        get_types_func: Function to extract unique product types
+        unique_brands: Sorted brand names to offer
+        product_types: Sorted product types to offer
         reset_func: Function to reset filters
         
     Returns:
@@ -43,9 +57,11 @@ def display_filter_sidebar(
     """
     st.sidebar.header("Filter Results")
     
-    # Get unique values for filters
-    unique_brands = get_brands_func(cosmetics)
-    product_types = get_types_func(cosmetics)
+    # Read the saved filter state once for this rerun
+    ss = st.session_state
+    saved_brand = ss.get('selected_brand')
+    saved_product_type = ss.get('selected_product_type')
+    saved_products_per_category = ss.get('products_per_category', 3)
     
     # Product count selector
     st.sidebar.subheader("Display Options")
@@ -53,18 +69,18 @@ def display_filter_sidebar(
         "Products per category", 
         min_value=1, 
         max_value=10, 
-        value=st.session_state.get('products_per_category', 3),
+        value=saved_products_per_category,
         key="product_count_slider",
         help="Select how many products to show in each category"
     )
-    st.session_state['products_per_category'] = products_per_category
+    ss['products_per_category'] = products_per_category
     
     # Brand filter
     st.sidebar.subheader("Brand Filter")
     brands_list = ["All Brands"] + unique_brands
     brand_index = 0
-    if st.session_state.get('selected_brand') != "All Brands" and st.session_state.get('selected_brand') in unique_brands:
-        brand_index = brands_list.index(st.session_state.get('selected_brand'))
+    if saved_brand != "All Brands" and saved_brand in unique_brands:
+        brand_index = brands_list.index(saved_brand)
     
     selected_brand = st.sidebar.selectbox(
         "Select a brand",
@@ -72,15 +88,15 @@ def display_filter_sidebar(
         index=brand_index,
         key="brand_selector"
     )
-    st.session_state['selected_brand'] = selected_brand
+    ss['selected_brand'] = selected_brand
     brand_filter = None if selected_brand == "All Brands" else selected_brand
     
     # Product type filter
     st.sidebar.subheader("Product Type")
     types_list = ["All Products"] + product_types
     type_index = 0
-    if st.session_state.get('selected_product_type') != "All Products" and st.session_state.get('selected_product_type') in product_types:
-        type_index = types_list.index(st.session_state.get('selected_product_type'))
+    if saved_product_type != "All Products" and saved_product_type in product_types:
+        type_index = types_list.index(saved_product_type)
         
     selected_product_type = st.sidebar.selectbox(
         "Select product type",
@@ -88,7 +104,7 @@ def display_filter_sidebar(
         index=type_index,
         key="product_type_selector"
     )
-    st.session_state['selected_product_type'] = selected_product_type
+    ss['selected_product_type'] = selected_product_type
     product_type_filter = None if selected_product_type == "All Products" else selected_product_type
     
     # Reset filters button
@@ -134,19 +150,21 @@ def display_product_recommendations(grouped_products: Dict[str, List[Dict[str, s
     if filtered_count == 0:
         st.info("No products match your filter criteria. Try changing your filters.")
     else:
-        # Display products by category
+        # Build all categories into one HTML block so the browser receives a
+        # single element instead of one per product
+        parts = []
         for category, products in grouped_products.items():
             if products:  # Only show categories with products
-                st.markdown(f"<div class='category-header'>{category}</div>", unsafe_allow_html=True)
-                
-                for product in products:
-                    st.markdown(f"""
-                    <div class='product-item'>
-                        <div class='product-name'>{product['name']}</div>
-                        <div class='product-brand'>{product['brand']}</div>
-                        <div class='product-color'>{product['color']}</div>
-                    </div>
-                    """, unsafe_allow_html=True)
+                parts.append(f"<div class='category-header'>{html.escape(category)}</div>")
+                parts.extend(
+                    "<div class='product-item'>"
+                    f"<div class='product-name'>{html.escape(product['name'])}</div>"
+                    f"<div class='product-brand'>{html.escape(product['brand'])}</div>"
+                    f"<div class='product-color'>{html.escape(product['color'])}</div>"
+                    "</div>"
+                    for product in products
+                )
+        st.markdown("".join(parts), unsafe_allow_html=True)
         
         st.success("These products were selected to complement your skin tone. Happy shopping! 🛍️")
 
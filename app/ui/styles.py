@@ -90,4 +90,12 @@ APP_CONFIG = {
     "icon": "💄",
     "layout": "centered",
     "sidebar_state": "expanded"
-} 
\ No newline at end of file
+}
+
+# Keyword arguments for st.set_page_config, built once at import
+PAGE_CONFIG = {
+    "page_title": APP_CONFIG["title"],
+    "page_icon": APP_CONFIG["icon"],
+    "layout": APP_CONFIG["layout"],
+    "initial_sidebar_state": APP_CONFIG["sidebar_state"]
+}
\ No newline at end of file
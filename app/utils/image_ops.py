@@ -0,0 +1,93 @@
+"""
+Low-level image operations that do not depend on OpenCV.
+"""
+import logging
+import numpy as np
+from PIL import Image
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Check if we can JIT-compile the pixel loops
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True)
+    def _swap_red_blue(src: np.ndarray, dst: np.ndarray) -> None:
+        """Copy src into dst with the first and third channels swapped."""
+        for i in prange(src.shape[0]):
+            for j in range(src.shape[1]):
+                dst[i, j, 0] = src[i, j, 2]
+                dst[i, j, 1] = src[i, j, 1]
+                dst[i, j, 2] = src[i, j, 0]
+
+def rgb_to_bgr(rgb_image: np.ndarray) -> np.ndarray:
+    """
+    Convert an RGB image array to BGR channel order.
+
+    Args:
+        rgb_image: Array of shape (H, W, 3)
+
+    Returns:
+        New contiguous array in BGR order
+    """
+    if not NUMBA_AVAILABLE:
+        return rgb_image[:, :, ::-1].copy()
+
+    bgr_image = np.empty(rgb_image.shape, dtype=rgb_image.dtype)
+    _swap_red_blue(rgb_image, bgr_image)
+    return bgr_image
+
+def resize_pil_to_max(pil_image: Image.Image, max_size: int) -> Image.Image:
+    """
+    Downscale a PIL Image in place so its longest side is at most max_size.
+    
+    Resizing before the NumPy conversion avoids materializing full-resolution
+    pixel arrays only to shrink them afterwards. JPEG images that have not
+    been loaded yet are decoded directly at a reduced 1/2, 1/4 or 1/8 scale.
+    
+    Args:
+        pil_image: PIL Image to resize (modified in place)
+        max_size: Maximum size of the longest image side
+        
+    Returns:
+        The same PIL Image
+    """
+    if pil_image.format == "JPEG":
+        # Let libjpeg scale in the DCT domain; a no-op once pixels are loaded
+        pil_image.draft("RGB", (max_size, max_size))
+    pil_image.thumbnail((max_size, max_size), Image.BILINEAR)
+    return pil_image
+
+def average_hash(image: Image.Image, hash_size: int = 8) -> int:
+    """
+    Compute a perceptual average hash of an image.
+    
+    The image is shrunk to hash_size x hash_size grayscale pixels and each
+    bit records whether a pixel is brighter than the mean, so re-encoded or
+    rescaled copies of a photo hash alike.
+    
+    Args:
+        image: PIL Image, ideally not yet loaded (modified in place)
+        hash_size: Side length of the hash grid
+        
+    Returns:
+        Hash as an integer of hash_size * hash_size bits
+    """
+    if image.format == "JPEG":
+        # Decode a grayscale, heavily reduced version straight from the DCT
+        image.draft("L", (hash_size * 8, hash_size * 8))
+    small = image.convert("L").resize((hash_size, hash_size), Image.BILINEAR)
+    pixels = np.asarray(small, dtype=np.float32)
+    bits = np.packbits(pixels > pixels.mean())
+    return int.from_bytes(bits.tobytes(), "big")
+
+def warm_up_image_ops() -> None:
+    """Compile the JIT kernels ahead of the first request."""
+    if NUMBA_AVAILABLE:
+        rgb_to_bgr(np.zeros((2, 2, 3), dtype=np.uint8))
+        logger.info("Image kernels compiled")
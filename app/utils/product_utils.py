@@ -1,9 +1,25 @@
 """
 Utility functions for product filtering, categorization, and organization.
 """
+import re
 from typing import Dict, List, Any
-from itertools import groupby
-from operator import itemgetter
+
+# Category keywords compiled into one pattern; each group sits in a lookahead
+# anchored at the start, so categories are tried in priority order (eye, lip,
+# cheek, face) rather than by leftmost keyword
+_CATEGORY_PATTERN = re.compile(
+    r"(?=.*(?P<eye>eyeshadow|eyeliner|mascara|eyebrow))"
+    r"|(?=.*(?P<lip>lipstick|lip gloss|lip liner))"
+    r"|(?=.*(?P<cheek>blush|bronzer|highlighter))"
+    r"|(?=.*(?P<face>foundation|concealer|powder))",
+    re.DOTALL
+)
+_GROUP_TO_CATEGORY = {
+    "eye": "Eye Products",
+    "lip": "Lip Products",
+    "cheek": "Cheek Products",
+    "face": "Face Products",
+}
 
 def categorize_product(product: Dict[str, str]) -> str:
     """
@@ -15,27 +31,8 @@ def categorize_product(product: Dict[str, str]) -> str:
     Returns:
         String category name
     """
-    name = product["name"].lower()
-    
-    # Eye products
-    if any(eye_term in name for eye_term in ["eyeshadow", "eyeliner", "mascara", "eyebrow"]):
-        return "Eye Products"
-    
-    # Lip products
-    elif any(lip_term in name for lip_term in ["lipstick", "lip gloss", "lip liner"]):
-        return "Lip Products"
-    
-    # Cheek products
-    elif any(cheek_term in name for cheek_term in ["blush", "bronzer", "highlighter"]):
-        return "Cheek Products"
-    
-    # Face products
-    elif any(face_term in name for face_term in ["foundation", "concealer", "powder"]):
-        return "Face Products"
-    
-    # Default category
-    else:
-        return "Other Products"
+    match = _CATEGORY_PATTERN.match(product["name"].lower())
+    return _GROUP_TO_CATEGORY[match.lastgroup] if match else "Other Products"
 
 def extract_product_type(product: Dict[str, str]) -> str:
     """
@@ -82,7 +79,7 @@ def get_unique_product_types(product_list: List[Dict[str, str]]) -> List[str]:
     types = set()
     for item in product_list:
         if "error" not in item and "name" in item:
-            product_type = extract_product_type(item)
+            product_type = item.get("product_type") or extract_product_type(item)
             if product_type:
                 types.add(product_type)
     return sorted(list(types))
@@ -105,33 +102,23 @@ def group_products_by_category(
     Returns:
         Dictionary of categorized and filtered products
     """
-    # Apply filters first
-    filtered_products = []
+    # Filter and bucket in a single pass; products keep their input order,
+    # and the database's per-tone tuples come sorted by category and name
+    grouped = {}
     for item in product_list:
-        if "error" in item:
-            filtered_products.append(item)
-            continue
-            
         # Apply brand filter if specified
         if brand_filter and item.get("brand") != brand_filter:
             continue
             
         # Apply product type filter if specified
-        if product_type_filter and product_type_filter not in item.get("name", "").lower():
-            continue
-            
-        # Add category to product
-        product_with_category = item.copy()
-        product_with_category["category"] = categorize_product(item)
-        filtered_products.append(product_with_category)
-    
-    # Sort by category
-    filtered_products.sort(key=itemgetter("category", "name"))
-    
-    # Group by category
-    grouped = {}
-    for key, group in groupby(filtered_products, key=itemgetter("category")):
-        # Limit to max_per_category products per category
-        grouped[key] = list(group)[:max_per_category]
+        if product_type_filter:
+            name_lc = item.get("_name_lc") or item.get("name", "").lower()
+            if product_type_filter not in name_lc:
+                continue
+        
+        # Database products carry a precomputed category; only others need one
+        bucket = grouped.setdefault(item.get("category") or categorize_product(item), [])
+        if len(bucket) < max_per_category:
+            bucket.append(item)
     
-    return grouped 
\ No newline at end of file
+    return grouped
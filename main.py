@@ -2,8 +2,10 @@
 Makeup Recommender - Main Application Entry Point.
 """
 import io
+import os
+import hashlib
 import streamlit as st
-from PIL import Image
+from PIL import Image, ImageOps
 import logging
 
 # Setup logging
@@ -13,24 +15,129 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize models first to avoid timeouts
-from app.models.init_models import initialize_models
-
-# Import application modules
-from app.models.cosmetics_model import analyze_image_with_timing
-from app.utils.product_utils import (
-    get_unique_brands, 
-    get_unique_product_types,
-    group_products_by_category
-)
-from app.ui.styles import MAIN_STYLES, APP_CONFIG
+# Import application modules; the model modules are imported on first upload
+# so the welcome screen paints without waiting for them
+from app.data.cosmetics_db import PRODUCTS_BY_TONE, BRANDS_BY_TONE, PRODUCT_TYPES_BY_TONE
+from app.utils.product_utils import group_products_by_category
+from app.ui.styles import APP_CONFIG, PAGE_CONFIG
 from app.ui.components import (
+    inject_styles,
     display_sidebar_info,
     display_filter_sidebar,
     display_product_recommendations,
     display_welcome_screen
 )
 
+# BLAKE3's SIMD kernels hash uploads several times faster than blake2b
+try:
+    import blake3
+    BLAKE3_AVAILABLE = True
+except ImportError:
+    BLAKE3_AVAILABLE = False
+
+# Key analysis results by perceptual hash so re-encoded copies of a photo hit
+# the cache; opt-in, because a grayscale hash cannot tell skin tones apart
+# between different photos that happen to look alike
+PERCEPTUAL_CACHE = os.environ.get("PERCEPTUAL_CACHE", "0") == "1"
+
+def open_upload(upload):
+    """Open an uploaded file lazily from its start, reading its own buffer."""
+    upload.seek(0)
+    return Image.open(upload)
+
+@st.cache_data(ttl=24 * 60 * 60, show_spinner=False)
+def cached_skin_tone_analysis(cache_key, _upload):
+    """
+    Analyze an uploaded photo once; reruns with the same photo reuse the result.
+    
+    Only the skin tone string is cached, so the product tuples handed to the
+    filters keep their identity across reruns. The upload itself is excluded
+    from hashing in favor of cache_key. Failures raise rather than return, so
+    they never enter the cache shared by all sessions.
+    
+    Returns:
+        Tuple of (skin tone, processing time in seconds)
+    """
+    from app.models.cosmetics_model import analyze_skin_tone_with_timing
+    from app.models.init_models import get_race_model
+    
+    # Open lazily so large JPEGs can be decoded at reduced size
+    img = open_upload(_upload)
+    
+    skin_tone, processing_time, error = analyze_skin_tone_with_timing(img, get_race_model())
+    if error:
+        raise RuntimeError(error)
+    return skin_tone, processing_time
+
+# Widest image st.image shows without resizing and re-encoding it server-side
+PREVIEW_MAX_SIZE = 1460
+
+def make_preview(upload):
+    """
+    Encode a display-sized JPEG copy of an uploaded photo.
+    
+    st.image decodes, resizes and re-encodes anything wider than the page on
+    every rerun; a preview within that width is passed through untouched.
+    
+    Args:
+        upload: Uploaded file object
+        
+    Returns:
+        JPEG bytes no larger than PREVIEW_MAX_SIZE on either side
+    """
+    from app.utils.image_ops import resize_pil_to_max
+    
+    preview = resize_pil_to_max(open_upload(upload), PREVIEW_MAX_SIZE)
+    # Re-encoding drops EXIF, so apply the camera's orientation to the pixels;
+    # the bound is square, so rotating after the resize keeps it
+    preview = ImageOps.exif_transpose(preview)
+    
+    buffer = io.BytesIO()
+    preview.convert("RGB").save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+def analysis_cache_key(upload, file_id):
+    """Cache key for an upload: its content digest, or its perceptual hash."""
+    if PERCEPTUAL_CACHE:
+        from app.utils.image_ops import average_hash
+        return average_hash(open_upload(upload))
+    return file_id
+
+def upload_digest(img_buffer):
+    """Short content hash identifying an upload across reruns."""
+    if BLAKE3_AVAILABLE:
+        return blake3.blake3(img_buffer).hexdigest(8)
+    return hashlib.blake2b(img_buffer, digest_size=8).hexdigest()
+
+# Upload limits checked before any pixel data is decoded
+MAX_UPLOAD_BYTES = 20_000_000
+MAX_UPLOAD_PIXELS = 25_000_000
+
+def validate_upload(upload, size):
+    """
+    Check an upload's size and image header without decoding its pixels.
+    
+    Args:
+        upload: Uploaded file object
+        size: Upload size in bytes
+        
+    Returns:
+        Error message to show, or None if the upload looks processable
+    """
+    if size > MAX_UPLOAD_BYTES:
+        return "Image file too large (>20 MB); please upload a smaller photo."
+    
+    try:
+        with open_upload(upload) as header:
+            width, height = header.size
+            header.verify()
+    except Exception:
+        return "The uploaded file is not a valid image. Please try a different photo."
+    
+    if width * height > MAX_UPLOAD_PIXELS:
+        return "Image too large (>25 MP); please resize."
+    return None
+
 # Initialize session state for filters
 def init_session_state():
     """Initialize session state variables if they don't exist."""
@@ -51,21 +158,104 @@ def reset_all_filters():
     st.session_state.selected_product_type = "All Products"
     st.session_state.products_per_category = 3
 
+def run_analysis(uploaded_file, file_id):
+    """
+    Analyze an uploaded photo, reporting failures instead of raising them.
+    
+    Args:
+        uploaded_file: Uploaded file object that passed validate_upload
+        file_id: Content digest of the upload
+        
+    Returns:
+        Tuple of (skin tone, processing time in seconds, error message)
+    """
+    try:
+        skin_tone, proc_time = cached_skin_tone_analysis(
+            analysis_cache_key(uploaded_file, file_id), uploaded_file
+        )
+        return skin_tone, proc_time, None
+    except Exception as e:
+        logger.error(f"Image processing error: {str(e)}")
+        return None, 0, str(e)
+
+def display_upload_results(uploaded_file):
+    """Validate and analyze an uploaded photo, then show recommendations."""
+    # View the upload's buffer in place rather than copying it into a new
+    # bytes object
+    img_buffer = uploaded_file.getbuffer()
+    if not img_buffer:
+        st.error("The uploaded file appears to be empty. Please try uploading a different image.")
+        return
+    
+    # Widget reruns with the same photo reuse this session's analysis and
+    # skip validation, cache key hashing and cache lookups
+    file_id = upload_digest(img_buffer)
+    analysis = None
+    if st.session_state.get("last_file_id") == file_id:
+        analysis = st.session_state.get("last_analysis")
+    
+    if analysis is None:
+        upload_error = validate_upload(uploaded_file, img_buffer.nbytes)
+        if upload_error:
+            st.error(upload_error)
+            return
+    
+    # Build the preview once per photo; reruns reuse it from the session
+    preview = st.session_state.get("preview")
+    if preview is None or preview[0] != file_id:
+        preview = (file_id, make_preview(uploaded_file))
+        st.session_state["preview"] = preview
+    
+    col1, col2 = st.columns([1, 1])
+    
+    with col1:
+        st.image(preview[1], caption="Your Photo", width=None)
+    
+    with col2:
+        if analysis is None:
+            with st.spinner("Analyzing your skin tone..."):
+                # Analyze the image, reusing results across sessions
+                analysis = run_analysis(uploaded_file, file_id)
+            # Failures are retried on the next rerun rather than remembered
+            if analysis[2] is None:
+                st.session_state["last_file_id"] = file_id
+                st.session_state["last_analysis"] = analysis
+        skin_tone, proc_time, analysis_error = analysis
+        
+        if proc_time > 0:
+            st.caption(f"Analysis completed in {proc_time:.2f} seconds")
+    
+    if analysis_error:
+        st.error(f"😕 {analysis_error}")
+        st.info("Please try uploading a different image.")
+        return
+    cosmetics = PRODUCTS_BY_TONE[skin_tone]
+    
+    # Display sidebar with filters
+    filters = display_filter_sidebar(
+        BRANDS_BY_TONE[skin_tone],
+        PRODUCT_TYPES_BY_TONE[skin_tone],
+        reset_all_filters
+    )
+    
+    # Group and filter products
+    grouped_products = group_products_by_category(
+        cosmetics, 
+        max_per_category=filters["products_per_category"],
+        brand_filter=filters["brand_filter"],
+        product_type_filter=filters["product_type_filter"]
+    )
+    
+    # Display product recommendations
+    display_product_recommendations(grouped_products, filters)
+
 def main():
     """Main application function."""
     # Setup the application
-    st.set_page_config(
-        page_title=APP_CONFIG["title"],
-        page_icon=APP_CONFIG["icon"],
-        layout=APP_CONFIG["layout"],
-        initial_sidebar_state=APP_CONFIG["sidebar_state"]
-    )
-    
-    # Initialize DeepFace models
-    models_ready = initialize_models()
+    st.set_page_config(**PAGE_CONFIG)
     
     # Apply custom styles
-    st.markdown(MAIN_STYLES, unsafe_allow_html=True)
+    inject_styles()
     
     # Initialize session state
     init_session_state()
@@ -77,71 +267,21 @@ def main():
     # File uploader
     uploaded_file = st.file_uploader("Upload a face photo:", type=["jpg", "jpeg", "png"])
     
-    if uploaded_file is not None:
-        try:
-            # Process the image safely
-            img_bytes = uploaded_file.getvalue()
-            if not img_bytes:
-                st.error("The uploaded file appears to be empty. Please try uploading a different image.")
-                return
-                
-            # Read image for display
-            try:
-                # First, try to display the image directly
-                col1, col2 = st.columns([1, 1])
-                
-                with col1:
-                    st.image(img_bytes, caption="Your Photo", width=None)
-                
-                with col2:
-                    with st.spinner("Analyzing your skin tone..."):
-                        # Open and convert the image for processing
-                        img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-                        
-                        # Analyze the image
-                        cosmetics, proc_time = analyze_image_with_timing(img)
-                    
-                    if proc_time > 0:
-                        st.caption(f"Analysis completed in {proc_time:.2f} seconds")
-            
-                # Check for errors in analysis
-                has_error = False
-                for product in cosmetics:
-                    if "error" in product:
-                        st.error(f"😕 {product['error']}")
-                        has_error = True
-                        break
-                
-                if not has_error:
-                    # Display sidebar with filters
-                    filters = display_filter_sidebar(
-                        cosmetics,
-                        get_unique_brands,
-                        get_unique_product_types,
-                        reset_all_filters
-                    )
-                    
-                    # Group and filter products
-                    grouped_products = group_products_by_category(
-                        cosmetics, 
-                        max_per_category=filters["products_per_category"],
-                        brand_filter=filters["brand_filter"],
-                        product_type_filter=filters["product_type_filter"]
-                    )
-                    
-                    # Display product recommendations
-                    display_product_recommendations(grouped_products, filters)
-            except Exception as e:
-                st.error(f"Error processing image: {str(e)}")
-                st.info("Please try uploading a different image.")
-                logger.error(f"Image processing error: {str(e)}")
-        except Exception as e:
-            st.error(f"Unexpected error: {str(e)}")
-            logger.error(f"Unexpected error: {str(e)}")
-    else:
+    if uploaded_file is None:
         # Display the welcome screen and sidebar info
         display_sidebar_info()
         display_welcome_screen()
+        
+        # Download and build the models while the user picks a photo
+        from app.models.init_models import start_background_warmup
+        start_background_warmup()
+        return
+    
+    # Initialize models on the first upload rather than before first paint
+    from app.models.init_models import initialize_models
+    initialize_models()
+    
+    display_upload_results(uploaded_file)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file
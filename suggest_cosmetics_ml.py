@@ -5,8 +5,12 @@ This file is maintained for backward compatibility with older code.
 New code should import directly from the app packages.
 """
 
-# Import functionality from the modular app structure
-from app.models.cosmetics_model import load_model, predict_cosmetics
-
 # Re-export the functions for backward compatibility
-__all__ = ['load_model', 'predict_cosmetics'] 
\ No newline at end of file
+__all__ = ['load_model', 'predict_cosmetics']
+
+def __getattr__(name):
+    """Import the model functions on first access rather than at import time."""
+    if name in __all__:
+        from app.models import cosmetics_model
+        return getattr(cosmetics_model, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file